@@ -2,10 +2,77 @@
 """
 数据预处理模块
 """
+import math
+
 import pandas as pd
 
 DATA_DIR = './data'
 
+# AKShare 日线中文列名 -> 统一列名
+COLUMN_MAP = {
+    '日期': 'trade_date',
+    '股票代码': 'ts_code',
+    '开盘': 'open',
+    '收盘': 'close',
+    '最高': 'high',
+    '最低': 'low',
+    '成交量': 'volume',
+    '成交额': 'amount',
+    '振幅': 'amplitude',
+    '涨跌幅': 'pct_change',
+    '涨跌额': 'change',
+    '换手率': 'turnover'
+}
+PE_RANGE = (0, 100)  # PE有效区间（开区间）
+PB_RANGE = (0, 20)   # PB有效区间（开区间）
+
+
+def estimate_market_cap(close, volume, turnover):
+    """用成交量/换手率估算市值（AKShare不提供总股本数据），标量与Series通用"""
+    return close * volume / turnover * 100
+
+
+def clean_bar(bar, pe_fill=None, pb_fill=None):
+    """
+    对单根bar应用与 preprocess_data 相同的清洗规则（流式模式使用）
+    参数：
+        bar: 已合并行情与估值字段的字典（列名已统一）
+        pe_fill / pb_fill: 缺失PE/PB时的填充值（当日已到达bar的中位数）
+    返回：
+        清洗后的新字典；不满足规则时返回 None
+    """
+    bar = dict(bar)
+    # 删除交易量、收盘价为空的记录
+    if pd.isna(bar.get('volume')) or pd.isna(bar.get('close')):
+        return None
+    # 收盘价须为正的有限值，否则后续收益率计算会出现除零/溢出
+    if not math.isfinite(bar['close']) or bar['close'] <= 0:
+        return None
+
+    # 缺失的PE/PB用当日中位数填充
+    if pd.isna(bar.get('pe_ttm')):
+        bar['pe_ttm'] = pe_fill
+    if pd.isna(bar.get('pb')):
+        bar['pb'] = pb_fill
+    if pd.isna(bar['pe_ttm']) or pd.isna(bar['pb']):
+        return None
+
+    # 剔除PE/PB为负或极大值
+    if not (PE_RANGE[0] < bar['pe_ttm'] < PE_RANGE[1]):
+        return None
+    if not (PB_RANGE[0] < bar['pb'] < PB_RANGE[1]):
+        return None
+
+    # 换手率缺失或为0时无法估算市值，统一记为NaN以免单bar除零中断处理
+    # （向量化路径中换手率为0得到inf、缺失得到NaN；流式因子不使用市值）
+    turnover = bar.get('turnover')
+    if pd.isna(turnover) or turnover == 0:
+        bar['market_cap'] = float('nan')
+    else:
+        bar['market_cap'] = estimate_market_cap(bar['close'], bar['volume'], turnover)
+    return bar
+
+
 def preprocess_data():
     """主处理函数"""
     print("开始数据预处理...")
@@ -15,20 +82,7 @@ def preprocess_data():
 
     daily.drop(columns="ts_code",inplace=True)
     # 1. 重命名列以统一格式
-    daily.rename(columns={
-        '日期': 'trade_date',
-        '股票代码': 'ts_code',
-        '开盘': 'open',
-        '收盘': 'close',
-        '最高': 'high',
-        '最低': 'low',
-        '成交量': 'volume',
-        '成交额': 'amount',
-        '振幅': 'amplitude',
-        '涨跌幅': 'pct_change',
-        '涨跌额': 'change',
-        '换手率': 'turnover'
-    }, inplace=True)
+    daily.rename(columns=COLUMN_MAP, inplace=True)
     # 2. 合并数据集
     merged = pd.merge(daily, valuation, on=['ts_code', 'trade_date'], how='inner').sort_values(['trade_date', 'ts_code'])
     
@@ -44,12 +98,12 @@ def preprocess_data():
     merged['pb'] = merged['pb'].fillna(industry_pb)
 
     # 剔除PE/PB为负或极大值
-    merged = merged[(merged['pe_ttm'] > 0) & (merged['pe_ttm'] < 100)]
-    merged = merged[(merged['pb'] > 0) & (merged['pb'] < 20)]
+    merged = merged[(merged['pe_ttm'] > PE_RANGE[0]) & (merged['pe_ttm'] < PE_RANGE[1])]
+    merged = merged[(merged['pb'] > PB_RANGE[0]) & (merged['pb'] < PB_RANGE[1])]
 
     # 4. 计算基础指标
     # 注意：AKShare不提供总股本数据，这里使用市值估算
-    merged['market_cap'] = merged['close'] * merged['volume'] / merged['turnover'] * 100
+    merged['market_cap'] = estimate_market_cap(merged['close'], merged['volume'], merged['turnover'])
     
     # 保存处理后的数据
     merged.to_csv(f'{DATA_DIR}/clean_data.csv', index=False)
@@ -5,6 +5,8 @@ from datetime import datetime
 from config import END_DATE
 
 DATA_DIR = Path('./data')
+MOMENTUM_WINDOW = 10  # 动量回看天数
+VOL_WINDOW = 10       # 波动率滚动窗口
 
 
 def calculate_factors():
@@ -28,9 +30,9 @@ def calculate_factors():
     # 按股票代码分组计算
     grouped = df.groupby('ts_code')['close']
     # 动量因子
-    df['momentum'] = np.log(df['close'] / grouped.shift(periods=10))
+    df['momentum'] = np.log(df['close'] / grouped.shift(periods=MOMENTUM_WINDOW))
     # 低波动因子
-    df['low_vol'] = -grouped.pct_change().rolling(window=10, min_periods=10).std()
+    df['low_vol'] = -grouped.pct_change().rolling(window=VOL_WINDOW, min_periods=VOL_WINDOW).std()
 
     df = df.dropna(subset=['value', 'momentum', 'low_vol'])
     result_df = df[['trade_date', 'ts_code', 'value', 'momentum', 'low_vol']]
@@ -66,6 +66,30 @@ def generate_rebalance_dates(min_date, max_date):
 
 
 # ------------------- 因子标准化与组合构建 -------------------
+FACTOR_COLS = ['value', 'momentum', 'low_vol']
+
+
+def score_factors(factor_df):
+    """
+    按交易日截面标准化因子并等权合成综合得分（批量与流式模式共用）
+    参数：
+        factor_df: 因子数据（ts_code, trade_date, value, momentum, low_vol）
+    返回：
+        增加 standardized_* 与 composite_score 列的DataFrame
+    """
+    factor_df = factor_df.copy()
+    # 对每个调仓日的因子值独立标准化（消除当日量纲差异）
+    # 标准化公式：(因子值 - 当日因子均值) / 当日因子标准差（避免除零错误）
+    for col in FACTOR_COLS:
+        factor_df[f'standardized_{col}'] = factor_df.groupby('trade_date')[col].transform(
+            lambda x: (x - x.mean()) / x.std() if x.std() != 0 else 0  # 标准差为0时设为0
+        )
+
+    # 等权合成标准化因子（可调整为加权，如根据因子重要性赋权）
+    factor_df['composite_score'] = factor_df[[f'standardized_{col}' for col in FACTOR_COLS]].sum(axis=1)
+    return factor_df
+
+
 def build_portfolio_7d(factor_df, rebalance_dates, top_n=TOP_N):
     """
     每7天调仓的组合构建逻辑
@@ -86,18 +110,8 @@ def build_portfolio_7d(factor_df, rebalance_dates, top_n=TOP_N):
     if rebalance_df.empty:
         raise ValueError("调仓日无对应因子数据！请检查数据或调仓日生成逻辑。")
 
-    # -------------------- 步骤2：按调仓日标准化因子（关键） --------------------
-    # 对每个调仓日的因子值独立标准化（消除当日量纲差异）
-    # 标准化公式：(因子值 - 当日因子均值) / 当日因子标准差（避免除零错误）
-    factor_cols = ['value', 'momentum', 'low_vol']
-    for col in factor_cols:
-        rebalance_df[f'standardized_{col}'] = rebalance_df.groupby('trade_date')[col].transform(
-            lambda x: (x - x.mean()) / x.std() if x.std() != 0 else 0  # 标准差为0时设为0
-        )
-
-    # -------------------- 步骤3：合成综合得分并筛选持仓 --------------------
-    # 等权合成标准化因子（可调整为加权，如根据因子重要性赋权）
-    rebalance_df['composite_score'] = rebalance_df[[f'standardized_{col}' for col in factor_cols]].sum(axis=1)
+    # -------------------- 步骤2~3：按调仓日标准化因子并合成综合得分 --------------------
+    rebalance_df = score_factors(rebalance_df)
 
     # 按调仓日分组，筛选前TOP_N股票（综合得分降序）
     portfolios = []
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+流式信号模块（asyncio 事件驱动版）
+逐根消费数据源推送的日线/分钟bar，增量完成清洗、因子与综合得分更新，
+到达调仓日时输出与 portfolio_holding.csv 相同结构的目标权重
+"""
+import argparse
+import asyncio
+import csv
+import json
+import math
+import statistics
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from pathlib import Path
+
+import pandas as pd
+
+from data_cleaner import COLUMN_MAP, clean_bar
+from factor_calculation import MOMENTUM_WINDOW, VOL_WINDOW
+from portfoliobuild import REBALANCE_FREQ, TOP_N, score_factors
+
+# ------------------- 配置参数 -------------------
+DATA_DIR = Path('./data')
+BAR_FILE = DATA_DIR / 'stream_bars.csv'  # 本地追加写入的bar文件（列名同 stock_daily.csv + 估值字段）
+STREAM_PORTFOLIO_FILE = DATA_DIR / 'stream_portfolio_holding.csv'  # 输出持仓文件（ts_code, trade_date, weight）
+UNIVERSE_FILE = DATA_DIR / 'index_constituents.csv'  # 默认股票池（data_downloader 生成）
+POLL_INTERVAL = 1.0  # 文件轮询间隔（秒）
+NUMERIC_FIELDS = ['open', 'close', 'high', 'low', 'volume', 'amount', 'amplitude',
+                  'pct_change', 'change', 'turnover', 'pe_ttm', 'pb']
+
+
+# ------------------- bar 数据源 -------------------
+class BarSource(ABC):
+    """bar数据源基类：子类以异步生成器实现 bars()，逐根产出原始bar字典"""
+
+    @abstractmethod
+    def bars(self):
+        """返回逐根产出原始bar字典的异步迭代器"""
+
+
+class CsvTailSource(BarSource):
+    """
+    本地CSV文件追踪源（类似 tail -f）
+    参数：
+        path: bar文件路径，首行为表头，新bar以行追加
+        follow: 读到文件末尾后是否继续等待新行
+        poll_interval: 无新数据时的轮询间隔（秒）
+    """
+
+    def __init__(self, path=BAR_FILE, follow=True, poll_interval=POLL_INTERVAL):
+        self.path = Path(path)
+        self.follow = follow
+        self.poll_interval = poll_interval
+
+    async def bars(self):
+        # 文件尚未生成时等待
+        while not self.path.exists():
+            if not self.follow:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+        with open(self.path, encoding='utf-8', newline='') as f:
+            header = None
+            pending = ''
+            while True:
+                line = f.readline()
+                if not line:
+                    if not self.follow:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                # 写入方尚未写完整行时先缓存
+                pending += line
+                if not pending.endswith('\n'):
+                    continue
+                row = next(csv.reader([pending]))
+                pending = ''
+                if not row:
+                    continue
+                if header is None:
+                    header = row
+                    continue
+                yield dict(zip(header, row))
+
+            # 文件末尾无换行的最后一行
+            if pending.strip() and header is not None:
+                yield dict(zip(header, next(csv.reader([pending]))))
+
+
+class SocketBarSource(BarSource):
+    """
+    TCP socket 数据源（AKShare 实时推送的替身）
+    每行一个JSON对象，字段同 CsvTailSource；对端关闭连接即结束
+    """
+
+    def __init__(self, host='127.0.0.1', port=9000):
+        self.host = host
+        self.port = port
+
+    async def bars(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"警告：无法解析的bar数据，已跳过: {e}")
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+
+# ------------------- bar 标准化 -------------------
+def _to_float(value):
+    """转换为浮点数，空值/非法值返回 NaN"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def normalize_bar(raw):
+    """
+    统一原始bar的列名与类型（与 preprocess_data 的重命名规则一致）
+    返回：列名统一后的bar字典，trade_date 为 Timestamp
+    异常：缺少股票代码/日期或日期无法解析时抛出 ValueError
+    """
+    if not isinstance(raw, dict):
+        raise ValueError(f"bar应为字典，实际为 {type(raw).__name__}")
+    bar = dict(raw)
+    for src, dst in COLUMN_MAP.items():
+        if src in bar:
+            bar[dst] = bar.pop(src)
+    for field in NUMERIC_FIELDS:
+        if field in bar:
+            bar[field] = _to_float(bar[field])
+
+    if pd.isna(bar.get('ts_code')) or str(bar['ts_code']).strip() == '':
+        raise ValueError("缺少股票代码")
+    bar['ts_code'] = str(bar['ts_code']).strip()
+    try:
+        trade_date = pd.Timestamp(bar.get('trade_date'))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"无法解析的日期 {bar.get('trade_date')!r}") from e
+    if pd.isna(trade_date):
+        raise ValueError("缺少交易日期")
+    bar['trade_date'] = trade_date
+    return bar
+
+
+# ------------------- 流式信号引擎 -------------------
+class StreamSignalEngine:
+    """
+    增量信号引擎
+    参数：
+        top_n: 每期持仓股票数量
+        rebalance_freq: 调仓频率（与 portfoliobuild.REBALANCE_FREQ 同格式）
+        anchor_date: 调仓日起点；为空时取首个有完整因子的交易日（同批量模式）
+        universe: 股票池；提供时当日全部股票到齐即视为收盘（仅适用于日线bar，
+                  一旦bar带有时刻即自动停用），否则在下一交易日首根bar到达或数据流结束/被停止时收盘
+        output_file: 持仓追加写入的文件，为空则不落盘；重启回放时不重复写入文件中已有的调仓日
+    """
+
+    def __init__(self, top_n=TOP_N, rebalance_freq=REBALANCE_FREQ, anchor_date=None,
+                 universe=None, output_file=STREAM_PORTFOLIO_FILE):
+        self.top_n = top_n
+        self.rebalance_freq = pd.Timedelta(rebalance_freq)
+        self.anchor_date = pd.Timestamp(anchor_date).normalize() if anchor_date is not None else None
+        self.universe = {str(code) for code in universe} if universe is not None else None
+        self.output_file = Path(output_file) if output_file is not None else None
+        self.intraday = False  # 是否检测到分钟bar（trade_date 带时刻）
+        self.last_written = self._load_last_written()  # 输出文件中最后一个调仓日
+
+        # 已收盘交易日的收盘价（每只股票仅保留因子计算所需的窗口）
+        self.history = defaultdict(lambda: deque(maxlen=max(MOMENTUM_WINDOW, VOL_WINDOW)))
+        # 当前交易日状态
+        self.current_date = None
+        self.day_closed = False
+        self.day_seen = set()  # 当日已到达bar的股票
+        self.day_close = {}  # {ts_code: 当日最新收盘价}
+        self.day_pe = {}     # {ts_code: 原始PE}，用于缺失值中位数填充
+        self.day_pb = {}
+        self.factors = {}    # {ts_code: {value, momentum, low_vol}}
+        # 每根bar的处理延迟（毫秒）
+        self.latencies_ms = []
+
+    # -------------------- 单根bar处理 --------------------
+    def on_bar(self, raw):
+        """
+        处理一根bar
+        返回：触发调仓时的持仓DataFrame（ts_code, trade_date, weight），否则为 None
+        """
+        start = time.perf_counter()
+        holdings = None
+        try:
+            holdings = self._process(normalize_bar(raw))
+        except ValueError as e:
+            print(f"警告：无效的bar数据，已跳过: {e}")
+        except Exception as e:
+            # 单根bar的意外错误不应中断整个数据流
+            print(f"警告：处理bar时出错，已跳过: {e!r}")
+
+        latency = (time.perf_counter() - start) * 1000
+        self.latencies_ms.append(latency)
+        if holdings is not None:
+            print(f"本bar处理延迟 {latency:.3f} ms（含调仓计算）")
+        return holdings
+
+    def _process(self, bar):
+        """按交易日推进状态并处理已标准化的bar，返回持仓DataFrame或 None"""
+        holdings = None
+        bar_date = bar['trade_date'].normalize()
+        if not self.intraday and bar['trade_date'] != bar_date:
+            self.intraday = True
+            if self.universe is not None:
+                print("警告：检测到分钟bar，停用股票池提前收盘，改为下一交易日首根bar到达时收盘")
+
+        if self.current_date is not None and bar_date < self.current_date:
+            print(f"警告：{bar['ts_code']} 的bar日期 {bar_date.strftime('%Y-%m-%d')} 早于当前交易日，已跳过")
+        elif self.current_date is not None and bar_date == self.current_date and self.day_closed:
+            print(f"警告：{bar_date.strftime('%Y-%m-%d')} 已收盘，{bar['ts_code']} 的迟到bar已跳过")
+        else:
+            if self.current_date is not None and bar_date > self.current_date:
+                holdings = self.close_day()
+            if self.current_date is None or bar_date > self.current_date:
+                self._start_day(bar_date)
+            self.day_seen.add(bar['ts_code'])
+            self._update(bar)
+            if not self.intraday and self.universe is not None and self.universe <= self.day_seen:
+                holdings = self.close_day()
+        return holdings
+
+    def _start_day(self, trade_date):
+        self.current_date = trade_date
+        self.day_closed = False
+        self.day_seen = set()
+        self.day_close = {}
+        self.day_pe = {}
+        self.day_pb = {}
+        self.factors = {}
+
+    def _update(self, bar):
+        """增量清洗并更新该股票的因子值"""
+        ts_code = bar['ts_code']
+        # 记录原始PE/PB，缺失值按当日已到达bar的中位数填充
+        if not pd.isna(bar.get('pe_ttm')):
+            self.day_pe[ts_code] = bar['pe_ttm']
+        if not pd.isna(bar.get('pb')):
+            self.day_pb[ts_code] = bar['pb']
+        pe_fill = statistics.median(self.day_pe.values()) if self.day_pe else None
+        pb_fill = statistics.median(self.day_pb.values()) if self.day_pb else None
+
+        bar = clean_bar(bar, pe_fill, pb_fill)
+        if bar is None:
+            self.factors.pop(ts_code, None)
+            return
+
+        close = bar['close']
+        self.day_close[ts_code] = close
+        history = self.history[ts_code]
+
+        # 动量因子：当前价相对 MOMENTUM_WINDOW 个交易日前收盘价的对数收益
+        momentum = math.log(close / history[-MOMENTUM_WINDOW]) if len(history) >= MOMENTUM_WINDOW else math.nan
+        # 低波动因子：最近 VOL_WINDOW 个日收益率标准差的相反数
+        if len(history) >= VOL_WINDOW:
+            closes = list(history)[-VOL_WINDOW:] + [close]
+            returns = [cur / prev - 1 for prev, cur in zip(closes[:-1], closes[1:])]
+            low_vol = -statistics.stdev(returns)
+        else:
+            low_vol = math.nan
+
+        if math.isnan(momentum) or math.isnan(low_vol):
+            self.factors.pop(ts_code, None)
+            return
+        self.factors[ts_code] = {'value': 1 / bar['pe_ttm'], 'momentum': momentum, 'low_vol': low_vol}
+
+    # -------------------- 收盘与调仓 --------------------
+    def close_day(self):
+        """
+        当前交易日收盘：将当日收盘价并入历史，若为调仓日则生成持仓
+        返回：持仓DataFrame或 None
+        """
+        if self.current_date is None or self.day_closed:
+            return None
+        self.day_closed = True
+        for ts_code, close in self.day_close.items():
+            self.history[ts_code].append(close)
+
+        if not self.factors:
+            return None
+        if self.anchor_date is None:
+            self.anchor_date = self.current_date
+        if self.current_date < self.anchor_date:
+            return None
+        if (self.current_date - self.anchor_date) % self.rebalance_freq != pd.Timedelta(0):
+            return None
+        return self.rebalance()
+
+    def rebalance(self):
+        """按当前截面因子合成综合得分，选出前 top_n 只股票等权持有"""
+        factor_df = pd.DataFrame([
+            {'ts_code': ts_code, 'trade_date': self.current_date, **values}
+            for ts_code, values in self.factors.items()
+        ])
+        factor_df = score_factors(factor_df)
+        if factor_df['composite_score'].isna().all():
+            print(f"警告：{self.current_date.strftime('%Y-%m-%d')} 无有效因子，跳过调仓！")
+            return None
+
+        top_stocks = factor_df.nlargest(self.top_n, 'composite_score').copy()
+        top_stocks['weight'] = 1 / self.top_n
+        holdings = top_stocks[['ts_code', 'trade_date', 'weight']].reset_index(drop=True)
+
+        if self.output_file is None:
+            pass
+        elif self.last_written is not None and self.current_date <= self.last_written:
+            # 重启后从头回放重建历史，已输出过的调仓日不再重复写入
+            print(f"{self.current_date.strftime('%Y-%m-%d')} 调仓已存在于 {self.output_file}，跳过写入")
+        else:
+            self.output_file.parent.mkdir(parents=True, exist_ok=True)
+            holdings.to_csv(self.output_file, mode='a', index=False, header=not self.output_file.exists())
+            self.last_written = self.current_date
+        print(f"{self.current_date.strftime('%Y-%m-%d')} 调仓：{holdings['ts_code'].tolist()}")
+        return holdings
+
+    def _load_last_written(self):
+        """读取输出文件中已写入的最后一个调仓日，文件不存在或为空时返回 None"""
+        if self.output_file is None or not self.output_file.exists() or self.output_file.stat().st_size == 0:
+            return None
+        written = pd.read_csv(self.output_file, parse_dates=['trade_date'])['trade_date']
+        return written.max().normalize() if not written.empty else None
+
+    # -------------------- 运行入口 --------------------
+    async def run(self, source):
+        """
+        消费数据源直至结束；数据流结束或被取消（如 Ctrl-C）时对当前交易日收盘并输出延迟统计
+        返回：所有调仓日的持仓DataFrame列表
+        """
+        portfolios = []
+        try:
+            async for raw in source.bars():
+                holdings = self.on_bar(raw)
+                if holdings is not None:
+                    portfolios.append(holdings)
+        finally:
+            holdings = self.close_day()
+            if holdings is not None:
+                portfolios.append(holdings)
+            self.report_latency()
+        return portfolios
+
+    def report_latency(self):
+        """打印每根bar处理延迟统计（毫秒）"""
+        if not self.latencies_ms:
+            print("未处理任何bar")
+            return
+        ordered = sorted(self.latencies_ms)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        print(f"共处理 {len(ordered)} 根bar，延迟(ms)：均值 {statistics.mean(ordered):.3f}，"
+              f"中位数 {statistics.median(ordered):.3f}，P99 {p99:.3f}，最大 {ordered[-1]:.3f}")
+
+
+# ------------------- 主函数 -------------------
+def main():
+    parser = argparse.ArgumentParser(description='流式信号模式')
+    parser.add_argument('--source', choices=['csv', 'socket'], default='csv', help='bar数据源类型')
+    parser.add_argument('--path', default=str(BAR_FILE), help='csv数据源的bar文件路径')
+    parser.add_argument('--no-follow', action='store_true', help='读到文件末尾即结束（回放模式）')
+    parser.add_argument('--host', default='127.0.0.1', help='socket数据源地址')
+    parser.add_argument('--port', type=int, default=9000, help='socket数据源端口')
+    parser.add_argument('--universe', nargs='?', const=str(UNIVERSE_FILE), default=None,
+                        help=f'股票池文件（使用 code 列，默认 {UNIVERSE_FILE}）；仅日线bar适用，'
+                             '当日全部股票到齐即收盘并输出持仓。不指定时在下一交易日首根bar到达时收盘')
+    parser.add_argument('--anchor', default=None, help='调仓日起点（YYYY-MM-DD），默认取首个有效交易日')
+    args = parser.parse_args()
+
+    if args.source == 'csv':
+        source = CsvTailSource(args.path, follow=not args.no_follow)
+    else:
+        source = SocketBarSource(args.host, args.port)
+
+    universe = None
+    if args.universe is not None:
+        if Path(args.universe).exists():
+            universe = pd.read_csv(args.universe, dtype={'code': str})['code'].tolist()
+            print(f"股票池：{args.universe}（共 {len(universe)} 只），全部到齐即收盘")
+        else:
+            print(f"警告：股票池文件 {args.universe} 不存在，将在下一交易日首根bar到达时收盘")
+
+    engine = StreamSignalEngine(anchor_date=args.anchor, universe=universe)
+    print("开始流式信号计算...")
+    try:
+        asyncio.run(engine.run(source))
+    except KeyboardInterrupt:
+        print("已手动停止")
+    print("流式信号计算结束！")
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+流式信号模块测试
+校验流式因子与批量 calculate_factors 一致，以及异常bar、分钟bar、重启回放等场景
+运行：python -m pytest -q test_stream_signal.py
+"""
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import stream_signal as ss
+from factor_calculation import calculate_factors
+
+CODES = ['600000', '600001', '600002', '600003', '600004', '600005', '600006']
+
+
+def make_bars(days=25, seed=0):
+    """生成已合并行情与估值字段的日线bar（列名与 clean_data.csv 一致）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-06-02', periods=days)
+    rows = []
+    for code in CODES:
+        price = 10.0
+        for d in dates:
+            price *= 1 + rng.normal(0, 0.02)
+            rows.append({'trade_date': d.strftime('%Y-%m-%d'), 'ts_code': code, 'close': price,
+                         'volume': 1000.0, 'turnover': 1.0,
+                         'pe_ttm': rng.uniform(5, 50), 'pb': rng.uniform(1, 5)})
+    return pd.DataFrame(rows).sort_values(['trade_date', 'ts_code']).reset_index(drop=True)
+
+
+def replay_factors(engine, records):
+    """逐根回放bar，返回每个交易日收盘前的因子快照 {(trade_date, ts_code): factors}"""
+    snapshots = {}
+
+    def snapshot():
+        for code, values in engine.factors.items():
+            snapshots[(engine.current_date, code)] = values
+
+    for raw in records:
+        if engine.current_date is not None and pd.Timestamp(raw['trade_date']) != engine.current_date:
+            snapshot()
+        engine.on_bar(raw)
+    snapshot()
+    return snapshots
+
+
+def test_factors_match_batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    bars = make_bars()
+    bars.to_csv('data/clean_data.csv', index=False)
+    bars.to_csv('data/stream_bars.csv', index=False)
+
+    batch = calculate_factors()
+    batch['ts_code'] = batch['ts_code'].astype(str)
+
+    async def collect():
+        return [raw async for raw in ss.CsvTailSource('data/stream_bars.csv', follow=False).bars()]
+
+    stream = replay_factors(ss.StreamSignalEngine(output_file=None), asyncio.run(collect()))
+
+    # 批量的 low_vol 滚动窗口跨股票计算，此处只比较 value 与 momentum
+    assert set(stream) == set(zip(batch['trade_date'], batch['ts_code']))
+    for row in batch.itertuples():
+        values = stream[(row.trade_date, row.ts_code)]
+        assert values['value'] == pytest.approx(row.value)
+        assert values['momentum'] == pytest.approx(row.momentum)
+
+
+@pytest.mark.parametrize('bad_close', ['0', 'inf', '-1'])
+def test_bad_close_is_skipped(bad_close, capsys):
+    engine = ss.StreamSignalEngine(output_file=None)
+    records = make_bars().to_dict('records')
+    bad_index = len(records) - 3 * len(CODES)  # 倒数第3个交易日的某只股票，异常价仍留在历史窗口内
+    records[bad_index]['close'] = bad_close
+    bad_code = records[bad_index]['ts_code']
+    for raw in records:
+        engine.on_bar(raw)
+
+    closes = [close for history in engine.history.values() for close in history]
+    assert all(np.isfinite(close) and close > 0 for close in closes)
+    # 该股票在后续交易日仍能正常计算因子，且没有被 on_bar 兜底吞掉的异常
+    assert bad_code in engine.factors
+    assert '处理bar时出错' not in capsys.readouterr().out
+
+
+def test_intraday_bars_ignore_universe_close():
+    engine = ss.StreamSignalEngine(output_file=None, universe=['1', '2'])
+
+    def bar(ts, code, close):
+        return {'日期': ts, '股票代码': code, '收盘': close, '成交量': 1, '换手率': 1, 'pe_ttm': 5, 'pb': 1}
+
+    for ts, close in [('2025-06-02 09:31', 10), ('2025-06-02 09:32', 11)]:
+        for code in ['1', '2']:
+            engine.on_bar(bar(ts, code, close))
+    assert not engine.day_closed
+    assert engine.day_close == {'1': 11.0, '2': 11.0}
+
+    engine.on_bar(bar('2025-06-03 09:31', '1', 12))
+    assert list(engine.history['1']) == [11.0]
+
+
+def test_restart_does_not_duplicate_output(tmp_path):
+    output_file = tmp_path / 'holding.csv'
+    records = make_bars().to_dict('records')
+    for _ in range(2):
+        engine = ss.StreamSignalEngine(output_file=output_file)
+        for raw in records:
+            engine.on_bar(raw)
+        engine.close_day()
+
+    written = pd.read_csv(output_file)
+    assert not written.duplicated(['ts_code', 'trade_date']).any()
+    assert (written.groupby('trade_date').size() == ss.TOP_N).all()